@@ -1,48 +1,57 @@
-from google import genai
 from google.genai import types
+import csv
+import io
 import json
+import math
 import os
 import argparse
 import pysubs2
 from dotenv import load_dotenv
+from gemini_utils import generate, make_client
 
 load_dotenv()
 
-def align_scripts(whisper_path, ocr_path, output_path, api_key=None):
+# Long transcripts are split into overlapping windows that are aligned concurrently
+WINDOW_SIZE = 200
+WINDOW_OVERLAP = 20
+# Extra share of the OCR lines given to each window on both sides of its proportional slice
+OCR_MARGIN = 0.1
+
+def split_windows(num_segments, window_size=WINDOW_SIZE, overlap=WINDOW_OVERLAP):
     """
-    Aligns Whisper transcription with OCR text using Gemini 2.5 Flash.
-    Generates ASS subtitles using pysubs2.
-    
+    Splits a transcript into overlapping windows of segments. Uses as few windows as
+    window_size allows and sizes them evenly, so no window is left with little but overlap.
+
     Args:
-        whisper_path (str): Path to Whisper JSON output.
-        ocr_path (str): Path to OCR text file.
-        output_path (str): Path to output .ass subtitle file.
-        api_key (str): Gemini API Key.
+        num_segments (int): Number of Whisper segments.
+        window_size (int): Maximum number of segments per window.
+        overlap (int): Number of segments shared by consecutive windows.
+
+    Returns:
+        list: (start, end) segment index ranges, end exclusive.
     """
-    if not api_key:
-        api_key = os.environ.get("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY not found in environment or arguments.")
+    if num_segments <= window_size:
+        return [(0, num_segments)]
 
-    client = genai.Client(api_key=api_key)
-    
-    print(f"Loading Whisper data from {whisper_path}...")
-    with open(whisper_path, "r", encoding="utf-8") as f:
-        whisper_data = json.load(f)
-        
-    print(f"Loading OCR text from {ocr_path}...")
-    with open(ocr_path, "r", encoding="utf-8") as f:
-        ocr_text = f.read()
+    num_windows = math.ceil((num_segments - overlap) / (window_size - overlap))
+    size = math.ceil((num_segments + (num_windows - 1) * overlap) / num_windows)
+    stride = size - overlap
+    return [(i * stride, min(i * stride + size, num_segments)) for i in range(num_windows)]
 
-    formatted_transcription = []
-    for t in whisper_data:
-        formatted_transcription.append({
-            "start": float(t['start']),
-            "end": float(t['end']),
-            "text": t['text']
-        })
-        
-    prompt = f"""
+def build_prompt(ocr_text, transcription):
+    """
+    Builds the alignment prompt for one window of the transcript.
+
+    Args:
+        ocr_text (str): Script text (ACTOR:TEXT lines) for this window.
+        transcription (list): Whisper segments for this window.
+    """
+    # Only start, end and text are useful to the model; the segment id would just cost tokens
+    transcription_json = json.dumps(
+        [{"start": t["start"], "end": t["end"], "text": t["text"]} for t in transcription],
+        ensure_ascii=False
+    )
+    return f"""
 You are an expert in Japanese script analysis and transcription.
 Your task is to align an automatic transcription with a golden reference script.
 
@@ -58,25 +67,132 @@ Golden Reference:
 {ocr_text}
 
 Whisper Transcriptions:
-{formatted_transcription}
+{transcription_json}
 
 Do not output comments or anything else.
 """
 
-    print("Sending request to Gemini 2.5 Flash with Thinking...")
-    model_id = 'gemini-2.5-flash' 
+def parse_events(text, lower=float("-inf"), upper=float("inf")):
+    """
+    Parses Gemini's "START; END; ACTOR; TEXT" output into subtitle events.
+
+    Args:
+        text (str): Raw response text.
+        lower (float): Events starting before this time (seconds) are dropped.
+        upper (float): Events starting at or after this time (seconds) are dropped.
+
+    Returns:
+        list: pysubs2.SSAEvent objects, malformed lines skipped.
+    """
+    # QUOTE_NONE: dialogue may contain '"', which must not be treated as CSV quoting
+    reader = csv.reader(io.StringIO(text), delimiter=';', quoting=csv.QUOTE_NONE, skipinitialspace=True)
+
+    events = []
+    for row in reader:
+        if len(row) < 4:
+            continue
+
+        try:
+            start_sec = float(row[0])
+            end_sec = float(row[1])
+        except ValueError:
+            continue
+
+        if not lower <= start_sec < upper:
+            continue
 
-    response = client.models.generate_content(
-        model=model_id,
-        contents=[prompt],
-        config=types.GenerateContentConfig(
-            thinking_config=types.ThinkingConfig(thinking_budget=20000)
-        )
+        # pysubs2 uses milliseconds for start and end times
+        events.append(pysubs2.SSAEvent(
+            start=int(start_sec * 1000),
+            end=int(end_sec * 1000),
+            text=row[3].strip(),
+            name=row[2].strip()
+        ))
+
+    return events
+
+def load_whisper_data(path):
+    """
+    Loads Whisper segments from a JSON Lines transcript, or from a JSON array
+    as written by earlier versions of generate_whisper.py.
+
+    Args:
+        path (str): Path to the Whisper transcript.
+
+    Returns:
+        list: Segment dicts with id, start, end and text.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    if content.lstrip().startswith("["):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+def align_scripts(whisper_path, ocr_path, output_path, api_key=None, batch_mode=False, use_cache=True):
+    """
+    Aligns Whisper transcription with OCR text using Gemini 2.5 Flash.
+    Generates ASS subtitles using pysubs2.
+    
+    Args:
+        whisper_path (str): Path to Whisper JSON Lines (or legacy JSON) output.
+        ocr_path (str): Path to OCR text file.
+        output_path (str): Path to output .ass subtitle file.
+        api_key (str): Gemini API Key.
+        batch_mode (bool): Submit the request as a Gemini Batch Mode job (cheaper, slower).
+        use_cache (bool): Reuse cached Gemini responses for windows that were already aligned.
+    """
+    if not api_key:
+        api_key = os.environ.get("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY not found in environment or arguments.")
+
+    client = make_client(api_key)
+    
+    print(f"Loading Whisper data from {whisper_path}...")
+    whisper_data = load_whisper_data(whisper_path)
+        
+    print(f"Loading OCR text from {ocr_path}...")
+    with open(ocr_path, "r", encoding="utf-8") as f:
+        ocr_text = f.read()
+
+    windows = split_windows(len(whisper_data))
+    ocr_lines = ocr_text.splitlines()
+
+    prompts = []
+    bounds = []
+    for i, (start, end) in enumerate(windows):
+        # The script has no timestamps, so give each window the proportional share of OCR lines plus a margin
+        if len(windows) == 1:
+            window_ocr = ocr_text
+        else:
+            lo = max(0.0, start / len(whisper_data) - OCR_MARGIN)
+            hi = min(1.0, end / len(whisper_data) + OCR_MARGIN)
+            window_ocr = "\n".join(ocr_lines[int(lo * len(ocr_lines)):int(hi * len(ocr_lines)) + 1])
+        prompts.append(build_prompt(window_ocr, whisper_data[start:end]))
+
+        # Overlapping windows hand over in the middle of the overlap, so each event is kept once
+        lower = bounds[-1][1] if bounds else float("-inf")
+        if i + 1 < len(windows):
+            cut = windows[i + 1][0] + (end - windows[i + 1][0]) // 2
+            upper = whisper_data[cut]["start"]
+        else:
+            upper = float("inf")
+        bounds.append((lower, upper))
+
+    model_id = 'gemini-2.5-flash' 
+    config = types.GenerateContentConfig(
+        thinking_config=types.ThinkingConfig(thinking_budget=20000)
     )
+    requests = [([prompt], config) for prompt in prompts]
+
+    print(f"Sending {len(requests)} request(s) to Gemini 2.5 Flash with Thinking{' (Batch Mode)' if batch_mode else ''}...")
+    responses = generate(client, model_id, requests, batch_mode=batch_mode,
+                         use_cache=use_cache, display_name="autotimer-align")
 
     print("Request finished.")
-    if response.usage_metadata:
-        print(f"Token Usage: Prompt: {response.usage_metadata.prompt_token_count}, Candidates: {response.usage_metadata.candidates_token_count}, Total: {response.usage_metadata.total_token_count}")
+    for response in responses:
+        if response.usage_metadata:
+            print(f"Token Usage: Prompt: {response.usage_metadata.prompt_token_count}, Candidates: {response.usage_metadata.candidates_token_count}, Total: {response.usage_metadata.total_token_count}")
 
     print("Generating ASS file using pysubs2...")
     subs = pysubs2.SSAFile()
@@ -89,31 +205,13 @@ Do not output comments or anything else.
     )
     subs.styles["Default"] = default_style
 
-    lines = response.text.strip().split('\n')
-    for line in lines:
-        if not line.strip():
-            continue
+    events = []
+    for response, (lower, upper) in zip(responses, bounds):
+        events.extend(parse_events(response.text or "", lower, upper))
 
-        parts = [p.strip() for p in line.split(';')]
-        if len(parts) < 4:
-            continue
-
-        try:
-            start_sec = float(parts[0])
-            end_sec = float(parts[1])
-            actor = parts[2]
-            text = parts[3]
-
-            # pysubs2 uses milliseconds for start and end times
-            event = pysubs2.SSAEvent(
-                start=int(start_sec * 1000),
-                end=int(end_sec * 1000),
-                text=text,
-                name=actor
-            )
-            subs.append(event)
-        except ValueError:
-            continue
+    # The model may emit lines slightly out of order; sort once before handing events to pysubs2
+    events.sort(key=lambda e: e.start)
+    subs.events.extend(events)
 
     print(f"Saving aligned subtitles to {output_path}...")
     subs.save(output_path)
@@ -123,11 +221,13 @@ Do not output comments or anything else.
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Align Whisper JSON and OCR Text to ASS subtitles.")
-    parser.add_argument("--whisper", required=True, help="Path to Whisper JSON file")
+    parser.add_argument("--whisper", required=True, help="Path to Whisper JSON Lines (or JSON) file")
     parser.add_argument("--ocr", required=True, help="Path to OCR text file")
     parser.add_argument("--output", required=True, help="Path to output ASS file")
     parser.add_argument("--api_key", help="Gemini API Key")
+    parser.add_argument("--batch_mode", action="store_true", help="Use Gemini Batch Mode (cheaper, but may take minutes to hours)")
+    parser.add_argument("--no_cache", action="store_true", help="Ignore cached Gemini responses and call the API again")
     
     args = parser.parse_args()
     
-    align_scripts(args.whisper, args.ocr, args.output, args.api_key)
+    align_scripts(args.whisper, args.ocr, args.output, args.api_key, batch_mode=args.batch_mode, use_cache=not args.no_cache)
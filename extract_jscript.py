@@ -1,12 +1,15 @@
 import argparse
 import os
-from google import genai
 from google.genai import types
 from dotenv import load_dotenv
+from gemini_utils import generate, is_cached, make_client, request_key
 
 load_dotenv()
 
-def extract_jscript(pdf_path, output_path, api_key=None):
+# Gemini rejects inline request payloads above 20 MB; larger PDFs go through the Files API
+INLINE_PDF_LIMIT = 20 * 1000 * 1000
+
+def extract_jscript(pdf_path, output_path, api_key=None, batch_mode=False, use_cache=True):
     """
     Extracts text from a Japanese PDF script using Gemini 2.5 Flash.
     
@@ -14,13 +17,15 @@ def extract_jscript(pdf_path, output_path, api_key=None):
         pdf_path (str): Path to the input PDF file.
         output_path (str): Path to save the extracted text.
         api_key (str): Gemini API Key.
+        batch_mode (bool): Submit the request as a Gemini Batch Mode job (cheaper, slower).
+        use_cache (bool): Reuse the cached Gemini response if this PDF was already extracted.
     """
     if not api_key:
         api_key = os.environ.get("GEMINI_API_KEY")
         if not api_key:
             raise ValueError("GEMINI_API_KEY not found in environment or arguments.")
 
-    client = genai.Client(api_key=api_key)
+    client = make_client(api_key)
     model_id = 'gemini-2.5-flash' 
 
     print(f"Reading PDF file: {pdf_path}...")
@@ -41,17 +46,38 @@ ACTOR:TEXT
 Do not output comments or anything else.
 """
 
-    print(f"Sending PDF to Gemini {model_id}...")
-    response = client.models.generate_content(
-        model=model_id,
-        contents=[
-            types.Part.from_bytes(
-                data=pdf_data,
-                mime_type='application/pdf'
+    contents = [
+        types.Part.from_bytes(
+            data=pdf_data,
+            mime_type='application/pdf'
+        ),
+        prompt
+    ]
+    # Keyed on the PDF bytes, so a cached result is found without uploading the file again
+    cache_key = request_key(model_id, contents)
+
+    # The limit applies to the request body, where the PDF is base64-encoded (4/3 of its raw size)
+    inline_size = len(pdf_data) * 4 / 3 + len(prompt.encode("utf-8"))
+    uploaded = None
+    if inline_size >= INLINE_PDF_LIMIT and not (use_cache and is_cached(cache_key)):
+        print(f"PDF is {len(pdf_data) / 1e6:.1f} MB, uploading it with the Files API...")
+        uploaded = client.files.upload(file=pdf_path, config=types.UploadFileConfig(mime_type='application/pdf'))
+        contents = [
+            types.Part.from_uri(
+                file_uri=uploaded.uri,
+                mime_type=uploaded.mime_type
             ),
             prompt
         ]
-    )
+
+    print(f"Sending PDF to Gemini {model_id}{' (Batch Mode)' if batch_mode else ''}...")
+    try:
+        response = generate(client, model_id, [(contents, None)], batch_mode=batch_mode,
+                            use_cache=use_cache, display_name="autotimer-extract", keys=[cache_key])[0]
+    finally:
+        # The response is cached by PDF bytes, so the uploaded copy is not needed again
+        if uploaded:
+            client.files.delete(name=uploaded.name)
     
     extracted_text = response.text or ""
     
@@ -66,7 +92,9 @@ if __name__ == "__main__":
     parser.add_argument("--pdf", required=True, help="Path to input PDF file")
     parser.add_argument("--output", required=True, help="Path to output text file")
     parser.add_argument("--api_key", help="Gemini API Key")
+    parser.add_argument("--batch_mode", action="store_true", help="Use Gemini Batch Mode (cheaper, but may take minutes to hours)")
+    parser.add_argument("--no_cache", action="store_true", help="Ignore cached Gemini responses and call the API again")
     
     args = parser.parse_args()
     
-    extract_jscript(args.pdf, args.output, args.api_key)
+    extract_jscript(args.pdf, args.output, args.api_key, batch_mode=args.batch_mode, use_cache=not args.no_cache)
@@ -0,0 +1,218 @@
+import asyncio
+import hashlib
+import os
+import time
+import httpx
+from google import genai
+from google.genai import errors, types
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "autotimer")
+MAX_CONCURRENT_REQUESTS = 8
+MAX_CONNECTIONS = 32
+# Rate limits and transient server errors are retried with exponential backoff: 2, 4, 8, 16, 32 s
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 2
+BATCH_POLL_INTERVAL = 30
+# Batch jobs expire after 48 hours on the server; stop waiting a little after that
+BATCH_TIMEOUT = 50 * 60 * 60
+# Older SDKs only map some Gemini API states to JOB_STATE_*, the rest keep their BATCH_STATE_* names
+BATCH_END_STATES = {
+    "JOB_STATE_SUCCEEDED",
+    "JOB_STATE_FAILED",
+    "JOB_STATE_CANCELLED",
+    "JOB_STATE_EXPIRED",
+    "BATCH_STATE_SUCCEEDED",
+    "BATCH_STATE_FAILED",
+    "BATCH_STATE_CANCELLED",
+    "BATCH_STATE_EXPIRED",
+}
+BATCH_SUCCESS_STATES = {"JOB_STATE_SUCCEEDED", "BATCH_STATE_SUCCEEDED"}
+
+def make_client(api_key):
+    """
+    Creates a Gemini client whose sync and async transports use HTTP/2 and keep-alive,
+    so concurrent requests share pooled connections instead of each opening a new one.
+
+    Args:
+        api_key (str): Gemini API Key.
+    """
+    limits = httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS)
+    # Passing explicit transports also keeps the SDK on httpx instead of switching to aiohttp
+    return genai.Client(
+        api_key=api_key,
+        http_options=types.HttpOptions(
+            client_args={"transport": httpx.HTTPTransport(http2=True, limits=limits)},
+            async_client_args={"transport": httpx.AsyncHTTPTransport(http2=True, limits=limits)}
+        )
+    )
+
+def request_key(model_id, contents, config=None):
+    """
+    Returns a stable hash of a generate_content request, used as its cache key.
+
+    Args:
+        model_id (str): Model the request is sent to.
+        contents (list): Prompt strings and/or types.Part objects.
+        config (types.GenerateContentConfig): Optional request config.
+    """
+    digest = hashlib.sha256(model_id.encode("utf-8"))
+    for item in contents:
+        # Parts serialize inline bytes (PDF pages, images) as base64, so the payload is part of the key
+        data = item if isinstance(item, str) else item.model_dump_json(exclude_none=True)
+        digest.update(b"\0" + data.encode("utf-8"))
+    if config is not None:
+        digest.update(b"\0" + config.model_dump_json(exclude_none=True).encode("utf-8"))
+    return digest.hexdigest()
+
+def is_cached(key):
+    return os.path.isfile(os.path.join(CACHE_DIR, f"{key}.json"))
+
+def load_cached_response(key):
+    path = os.path.join(CACHE_DIR, f"{key}.json")
+    if not os.path.isfile(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return types.GenerateContentResponse.model_validate_json(f.read())
+
+def is_complete_response(response):
+    """
+    Returns True if the response finished normally with text, so it is safe to replay from cache.
+    Blocked, truncated (MAX_TOKENS) and empty responses are not cached, so the next run retries them.
+    """
+    if not response.candidates or response.candidates[0].finish_reason != types.FinishReason.STOP:
+        return False
+    return bool(response.text)
+
+def save_cached_response(key, response):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = os.path.join(CACHE_DIR, f"{key}.json")
+    # Write then rename, so an interrupted run never leaves a truncated cache entry
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(response.model_dump_json(exclude_none=True))
+    os.replace(path + ".tmp", path)
+
+def generate(client, model_id, requests, batch_mode=False, use_cache=True, display_name=None, keys=None):
+    """
+    Runs generate_content requests, reusing cached responses for requests already seen.
+    Responses are cached on disk under ~/.cache/autotimer, keyed by model, prompt and payload.
+
+    Args:
+        client (genai.Client): Gemini client.
+        model_id (str): Model used for every request.
+        requests (list): List of (contents, config) tuples, config may be None.
+        batch_mode (bool): Submit uncached requests as a Batch Mode job instead of live calls.
+        use_cache (bool): Read and write the response cache.
+        display_name (str): Optional Batch Mode job name.
+        keys (list): Optional cache keys overriding the ones derived from requests,
+            for requests that reference uploaded files rather than inline bytes.
+
+    Returns:
+        list: GenerateContentResponse objects, in the same order as requests.
+    """
+    if keys is None:
+        keys = [request_key(model_id, contents, config) for contents, config in requests]
+    responses = [load_cached_response(key) if use_cache else None for key in keys]
+
+    missing = [i for i, response in enumerate(responses) if response is None]
+    if len(missing) < len(requests):
+        print(f"Reusing {len(requests) - len(missing)} cached Gemini response(s).")
+    if not missing:
+        return responses
+
+    def store(index, response):
+        responses[missing[index]] = response
+        if use_cache and is_complete_response(response):
+            save_cached_response(keys[missing[index]], response)
+
+    pending = [requests[i] for i in missing]
+    if batch_mode:
+        for index, response in enumerate(run_batch(client, model_id, pending, display_name=display_name)):
+            store(index, response)
+    else:
+        run_concurrent(client, model_id, pending, on_response=store)
+
+    return responses
+
+def run_concurrent(client, model_id, requests, max_concurrency=MAX_CONCURRENT_REQUESTS, on_response=None):
+    """
+    Sends requests as live generate_content calls, running up to max_concurrency at once.
+
+    Args:
+        client (genai.Client): Gemini client.
+        model_id (str): Model used for every request.
+        requests (list): List of (contents, config) tuples, config may be None.
+        max_concurrency (int): Maximum number of requests in flight.
+        on_response (callable): Optional callback, called with (index, response) as each request completes.
+
+    Returns:
+        list: GenerateContentResponse objects, in the same order as requests.
+    """
+    async def run_all():
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run_one(index, contents, config):
+            async with semaphore:
+                for attempt in range(MAX_RETRIES + 1):
+                    try:
+                        response = await client.aio.models.generate_content(
+                            model=model_id,
+                            contents=contents,
+                            config=config
+                        )
+                        break
+                    except errors.APIError as e:
+                        if attempt == MAX_RETRIES or not (e.code == 429 or e.code >= 500):
+                            raise
+                        delay = RETRY_BASE_DELAY * 2 ** attempt
+                        print(f"Gemini request failed with {e.code}, retrying in {delay}s...")
+                        await asyncio.sleep(delay)
+            if on_response:
+                on_response(index, response)
+            return response
+
+        return await asyncio.gather(*(run_one(i, contents, config) for i, (contents, config) in enumerate(requests)))
+
+    return asyncio.run(run_all())
+
+def run_batch(client, model_id, requests, display_name=None, poll_interval=BATCH_POLL_INTERVAL, timeout=BATCH_TIMEOUT):
+    """
+    Submits requests as an inline Gemini Batch Mode job and waits for it to finish.
+    Batch Mode is billed at a discount over live generate_content calls in exchange
+    for a turnaround of minutes to hours, which suits the offline pipeline steps.
+
+    Args:
+        client (genai.Client): Gemini client.
+        model_id (str): Model used for every request in the job.
+        requests (list): List of (contents, config) tuples, config may be None.
+        display_name (str): Optional job name shown in AI Studio.
+        poll_interval (float): Seconds to wait between job status checks.
+        timeout (float): Seconds to wait for the job before giving up.
+
+    Returns:
+        list: GenerateContentResponse objects, in the same order as requests.
+    """
+    job = client.batches.create(
+        model=model_id,
+        src=[types.InlinedRequest(contents=contents, config=config) for contents, config in requests],
+        config=types.CreateBatchJobConfig(display_name=display_name)
+    )
+    print(f"Submitted batch job {job.name}, waiting for it to finish...")
+
+    deadline = time.monotonic() + timeout
+    while job.state.name not in BATCH_END_STATES:
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"Batch job {job.name} still {job.state.name} after {timeout / 3600:.0f} hours")
+        time.sleep(poll_interval)
+        job = client.batches.get(name=job.name)
+        print(f"Batch job state: {job.state.name}")
+
+    if job.state.name not in BATCH_SUCCESS_STATES:
+        raise RuntimeError(f"Batch job {job.name} finished with state {job.state.name}: {job.error}")
+
+    responses = []
+    for inlined in job.dest.inlined_responses:
+        if inlined.error:
+            raise RuntimeError(f"Batch request failed: {inlined.error}")
+        responses.append(inlined.response)
+
+    return responses
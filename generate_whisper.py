@@ -1,77 +1,296 @@
-from faster_whisper import WhisperModel
+from faster_whisper import WhisperModel, BatchedInferencePipeline
+import ctranslate2
+import functools
+import numpy as np
 import json
 import os
+import subprocess
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 
-def generate_whisper_script(video_path, output_path, model_size="turbo", device="auto", compute_type="default", duration=None):
+SAMPLING_RATE = 16000
+# Silero VAD settings: cut at pauses of half a second or more
+VAD_PARAMETERS = {"min_silence_duration_ms": 500, "threshold": 0.5}
+
+# Fastest first; "auto" resolves to the first of these the device supports
+COMPUTE_TYPE_PREFERENCE = {
+    "cuda": ["int8_float16", "float16", "int8", "float32"],
+    "cpu": ["int8", "float32"],
+}
+
+def resolve_device(device):
+    """
+    Resolves device="auto" to "cuda" when CTranslate2 sees a CUDA device, otherwise "cpu".
+
+    Args:
+        device (str): Device to use for inference ("cuda", "cpu", "auto").
+    """
+    if device != "auto":
+        return device
+    return "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+
+def resolve_compute_type(device, compute_type):
+    """
+    Resolves compute_type="auto" to the fastest type CTranslate2 supports on the device.
+    Unlike "default", which keeps the converted weights' precision, this picks int8
+    kernels where available (int8_float16 on CUDA, int8 on CPU).
+
+    Args:
+        device (str): Resolved device ("cuda" or "cpu").
+        compute_type (str): Requested compute type.
+
+    Returns:
+        str: The resolved compute type, or compute_type unchanged if it is not "auto".
+    """
+    if compute_type != "auto":
+        return compute_type
+    supported = ctranslate2.get_supported_compute_types(device)
+    return next(ct for ct in COMPUTE_TYPE_PREFERENCE[device] if ct in supported)
+
+def load_audio(path, duration=None, sampling_rate=SAMPLING_RATE):
+    """
+    Decodes the audio track of a media file to mono float32 PCM with a single ffmpeg call.
+
+    Args:
+        path (str): Path to the input video or audio file.
+        duration (float): Optional limit, only the first N seconds are decoded.
+        sampling_rate (int): Output sampling rate expected by Whisper.
+
+    Returns:
+        numpy.ndarray: Audio samples in [-1, 1].
+    """
+    cmd = ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", path]
+    if duration:
+        cmd += ["-t", str(duration)]
+    cmd += ["-vn", "-ac", "1", "-ar", str(sampling_rate), "-f", "s16le", "-"]
+    try:
+        pcm = subprocess.run(cmd, capture_output=True, check=True).stdout
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Failed to decode audio from {path}: {e.stderr.decode(errors='replace').strip()}") from e
+    return np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+
+@functools.lru_cache(maxsize=2)
+def _load_model(model_size, device, compute_type):
+    print(f"Loading Whisper model: {model_size} on {device} ({compute_type})...")
+    return WhisperModel(model_size, device=device, compute_type=compute_type)
+
+def get_model(model_size, device, compute_type):
+    """
+    Loads a Whisper model once per process; later calls with the same arguments reuse it
+    instead of reloading the weights and reinitializing the device.
+
+    Args:
+        model_size (str): Whisper model size to use.
+        device (str): Device to use for inference ("cuda", "cpu", "auto").
+        compute_type (str): Resolved compute type.
+    """
+    return _load_model(model_size, device, compute_type)
+
+@functools.lru_cache(maxsize=2)
+def get_batched_pipeline(model_size, device, compute_type):
+    """
+    Returns the cached BatchedInferencePipeline wrapping get_model(model_size, device, compute_type).
+    """
+    return BatchedInferencePipeline(model=get_model(model_size, device, compute_type))
+
+def prewarm(model_size, device, compute_type):
+    """
+    Loads the pipeline and runs one second of silence through the model, so weight loading,
+    device memory pools and kernel selection are done before the first real transcription.
+    Callers run it in the thread that overlaps model loading with audio decoding.
+
+    Args:
+        model_size (str): Whisper model size to use.
+        device (str): Resolved device ("cuda" or "cpu").
+        compute_type (str): Resolved compute type.
+
+    Returns:
+        BatchedInferencePipeline: The cached pipeline, see get_batched_pipeline.
+    """
+    batched_model = get_batched_pipeline(model_size, device, compute_type)
+    segments, _ = batched_model.model.transcribe(np.zeros(SAMPLING_RATE, dtype=np.float32), language="ja")
+    # segments is lazy; consume it so the encoder and decoder actually run
+    list(segments)
+    return batched_model
+
+def transcribe_audio(batched_model, audio, output_path, duration=None, batch_size=16, word_timestamps=False, vad_filter=True):
+    """
+    Transcribes decoded audio with a loaded pipeline and streams the segments to a JSON Lines file.
+
+    Args:
+        batched_model (BatchedInferencePipeline): Loaded pipeline, see get_batched_pipeline.
+        audio (numpy.ndarray): Audio samples, see load_audio.
+        output_path (str): Path to save the output JSON Lines file (one segment per line).
+        duration (float): Optional limit to transcribe only up to this many seconds.
+        batch_size (int): Number of speech chunks decoded together by the batched pipeline.
+        word_timestamps (bool): Compute word timings and use them to tighten each segment's start.
+        vad_filter (bool): Skip silent regions with Silero VAD before they reach the encoder.
+    """
+    if vad_filter:
+        segments, info = batched_model.transcribe(audio,
+                                                  language="ja",
+                                                  batch_size=batch_size,
+                                                  vad_filter=True,
+                                                  vad_parameters=VAD_PARAMETERS,
+                                                  word_timestamps=word_timestamps,
+                                                  # The pipeline defaults to one segment per 20 s chunk; timestamp
+                                                  # tokens split each chunk back into one segment per utterance
+                                                  without_timestamps=False,
+                                                  chunk_length=20,
+                                                  log_progress=True)
+    else:
+        # The batched pipeline needs VAD to split the audio into independent chunks, so decode sequentially instead
+        segments, info = batched_model.model.transcribe(audio,
+                                                        language="ja",
+                                                        vad_filter=False,
+                                                        word_timestamps=word_timestamps,
+                                                        chunk_length=20,
+                                                        log_progress=True)
+
+    partial_path = output_path + ".part"
+    print(f"Writing transcription to {partial_path}...")
+    with open(partial_path, "w", encoding="utf-8") as f:
+        # segments is a lazy generator (log_progress=True drives the progress bar as it is consumed),
+        # so each segment is written as soon as it is decoded instead of being collected in memory
+        for segment in segments:
+            if duration and segment.start >= duration:
+                break
+
+            segment_start = segment.start
+    
+            # Without word_timestamps the segment keeps Whisper's own start time
+            words = segment.words
+            if words and len(words) > 1:
+                starts = np.fromiter((w.start for w in words), dtype=np.float64, count=len(words))
+                ends = np.fromiter((w.end for w in words), dtype=np.float64, count=len(words))
+
+                # Calculate average duration of words in the segment (excluding the first word)
+                avg_duration = (ends[1:] - starts[1:]).mean()
+            
+                # Adjust segment start
+                segment_start = float(max(starts[0], ends[0] - avg_duration))
+
+            segment_end = segment.end
+            if duration and segment_end > duration:
+                segment_end = duration
+
+            # Times are rounded once, here, since the subtitles only need centisecond precision
+            segment_data = {
+                "id": segment.id,
+                "start": round(segment_start, 2),
+                "end": round(segment_end, 2),
+                "text": segment.text
+            }
+
+            # JSON Lines: one complete segment per line, so partial output is always readable
+            f.write(json.dumps(segment_data, ensure_ascii=False) + "\n")
+
+    # Only a finished transcript takes the final name, so an interrupted run is never mistaken for a complete one
+    os.replace(partial_path, output_path)
+
+    print(f"\nTranscription saved to {output_path}.")
+    return output_path
+
+def generate_whisper_script(video_path, output_path, model_size="turbo", device="auto", compute_type="auto", duration=None, batch_size=16, word_timestamps=False, vad_filter=True):
     """
     Transcribes audio from a video file using faster-whisper.
     
     Args:
         video_path (str): Path to the input video file.
-        output_path (str): Path to save the output JSON file.
+        output_path (str): Path to save the output JSON Lines file (one segment per line).
         model_size (str): Whisper model size to use.
-        device (str): Device to use for inference ("cuda", "cpu", "auto").
-        compute_type (str): Compute type for inference ("float16", "int8_float16", "int8", "default").
+        device (str): Device to use for inference ("cuda", "cpu", "auto"). "auto" uses CUDA when available.
+        compute_type (str): Compute type for inference ("auto", "float16", "int8_float16", "int8", "default").
+            "auto" selects the fastest type supported by the device.
         duration (float): Optional limit to transcribe only up to this many seconds.
+        batch_size (int): Number of speech chunks decoded together by the batched pipeline.
+        word_timestamps (bool): Compute word timings and use them to tighten each segment's start.
+            Costs an extra alignment pass per segment.
+        vad_filter (bool): Skip silent regions with Silero VAD. Disabling it also disables batching.
     """
-    print(f"Loading Whisper model: {model_size} on {device}...")
-    model = WhisperModel(model_size, device=device, compute_type=compute_type)
+    device = resolve_device(device)
+    compute_type = resolve_compute_type(device, compute_type)
+    # Model loading and ffmpeg decoding are independent, so load and warm up the model in a thread while ffmpeg runs
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # Batches independent speech chunks through the model; VAD drops silence before decoding
+        pipeline_future = executor.submit(prewarm, model_size, device, compute_type)
+
+        print(f"Decoding audio from {video_path}...")
+        # With a duration limit only that much audio is decoded, so nothing past it is ever transcribed
+        audio = load_audio(video_path, duration=duration)
+
+        batched_model = pipeline_future.result()
 
     print(f"Transcribing {video_path}...")
-    segments, info = model.transcribe(video_path,
-                                      language="ja",
-                                      word_timestamps=True,
-                                      chunk_length=20,
-                                      log_progress=True)
-
-    transcript_data = []
-    # Using list(segments) as faster-whisper's log_progress=True handles the progress bar
-    for segment in list(segments):
-        if duration and segment.start >= duration:
-            break
-
-        words_data = []
-        segment_start = segment.start
-        
-        if segment.words:
-            words = list(segment.words)
-            if len(words) > 1:
-                # Calculate average duration of words in the segment (excluding the first word)
-                durations = [w.end - w.start for w in words[1:]]
-                avg_duration = round(sum(durations) / len(durations), 2)
-                
-                # Adjust segment start
-                new_start = max(words[0].start, words[0].end - avg_duration)
-                segment_start = round(new_start,2)
+    return transcribe_audio(batched_model, audio, output_path, duration=duration,
+                            batch_size=batch_size, word_timestamps=word_timestamps, vad_filter=vad_filter)
+
+def transcribe_many(video_paths, output_dir, model_size="turbo", device="auto", compute_type="auto", duration=None, batch_size=16, word_timestamps=False, vad_filter=True):
+    """
+    Transcribes several videos with a single loaded model. The next file's audio is
+    decoded while the current one is being transcribed.
+
+    Args:
+        video_paths (list): Paths to the input video files.
+        output_dir (str): Directory for the <video name>_whisper.jsonl outputs.
+        model_size, device, compute_type, duration, batch_size, word_timestamps, vad_filter: See generate_whisper_script.
+
+    Returns:
+        list: Output paths, in the same order as video_paths.
+    """
+    # Outputs are named after the video's file name, so two videos with the same name would overwrite each other
+    output_paths = []
+    for video_path in video_paths:
+        base_name = os.path.splitext(os.path.basename(video_path))[0]
+        output_path = os.path.join(output_dir, f"{base_name}_whisper.jsonl")
+        if output_path in output_paths:
+            raise ValueError(f"Several input videos are named {base_name}, their transcripts would overwrite {output_path}.")
+        output_paths.append(output_path)
+
+    if not video_paths:
+        return output_paths
 
-        segment_end = round(segment.end, 2)
-        if duration and segment_end > duration:
-            segment_end = duration
+    device = resolve_device(device)
+    compute_type = resolve_compute_type(device, compute_type)
+    os.makedirs(output_dir, exist_ok=True)
 
-        segment_data = {
-            "id": segment.id,
-            "start": segment_start,
-            "end": segment_end,
-            "text": segment.text
-        }
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        pipeline_future = executor.submit(prewarm, model_size, device, compute_type)
+        audio_future = executor.submit(load_audio, video_paths[0], duration)
+        batched_model = pipeline_future.result()
 
-        transcript_data.append(segment_data)
+        for i, video_path in enumerate(video_paths):
+            audio = audio_future.result()
+            if i + 1 < len(video_paths):
+                audio_future = executor.submit(load_audio, video_paths[i + 1], duration)
 
-    print(f"\nSaving transcription to {output_path}...")
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(transcript_data, f, ensure_ascii=False, indent=4)
+            print(f"Transcribing {video_path} ({i + 1}/{len(video_paths)})...")
+            transcribe_audio(batched_model, audio, output_paths[i], duration=duration,
+                             batch_size=batch_size, word_timestamps=word_timestamps, vad_filter=vad_filter)
 
-    return transcript_data
+    return output_paths
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate Whisper transcription from video.")
-    parser.add_argument("--video", required=True, help="Path to input video file")
-    parser.add_argument("--output", required=True, help="Path to output JSON file")
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument("--video", help="Path to input video file")
+    inputs.add_argument("--videos", nargs="+", help="Paths to several input video files, transcribed with one loaded model")
+    parser.add_argument("--output", required=True, help="Path to output JSON Lines file (output directory with --videos)")
     parser.add_argument("--model", default="turbo", help="Whisper model size")
     parser.add_argument("--device", default="auto", help="Device to use (cpu, cuda, auto)")
+    parser.add_argument("--compute_type", default="auto", help="Compute type (auto, float16, int8_float16, int8, default)")
     parser.add_argument("--duration", type=float, help="Limit transcription to first N seconds")
+    parser.add_argument("--batch_size", type=int, default=16, help="Speech chunks decoded per batch (lower it if you run out of VRAM)")
+    parser.add_argument("--word_timestamps", action="store_true", help="Use word timings to refine segment start times (slower)")
+    parser.add_argument("--no_vad", action="store_true", help="Transcribe silent regions too (disables VAD and batching)")
     
     args = parser.parse_args()
     
-    generate_whisper_script(args.video, args.output, args.model, args.device, duration=args.duration)
+    if args.videos:
+        transcribe_many(args.videos, args.output, args.model, args.device, args.compute_type,
+                        duration=args.duration, batch_size=args.batch_size, word_timestamps=args.word_timestamps,
+                        vad_filter=not args.no_vad)
+    else:
+        generate_whisper_script(args.video, args.output, args.model, args.device, args.compute_type,
+                                duration=args.duration, batch_size=args.batch_size, word_timestamps=args.word_timestamps,
+                                vad_filter=not args.no_vad)
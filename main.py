@@ -1,6 +1,7 @@
 import argparse
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from generate_whisper import generate_whisper_script
 from extract_jscript import extract_jscript
 from align_scripts import align_scripts
@@ -15,35 +16,54 @@ def main():
     parser.add_argument("--output", default="aligned.ass", help="Path to output ASS file")
     parser.add_argument("--api_key", help="Gemini API Key (optional if GEMINI_API_KEY env var is set)")
     parser.add_argument("--whisper_model", default="turbo", help="Whisper model size (default: turbo)")
+    parser.add_argument("--compute_type", default="auto", help="Whisper compute type (default: auto, the fastest supported by the device)")
     parser.add_argument("--duration", type=float, help="Limit transcription to first N seconds")
+    parser.add_argument("--batch_size", type=int, default=16, help="Whisper speech chunks decoded per batch (default: 16)")
+    parser.add_argument("--word_timestamps", action="store_true", help="Use Whisper word timings to refine segment start times (slower)")
+    parser.add_argument("--no_vad", action="store_true", help="Transcribe silent regions too (disables VAD and Whisper batching)")
+    parser.add_argument("--batch_mode", action="store_true", help="Use Gemini Batch Mode for OCR and alignment (cheaper, but may take minutes to hours)")
+    parser.add_argument("--no_cache", action="store_true", help="Ignore cached Gemini responses and call the API again")
     
     args = parser.parse_args()
 
     # Derived paths for intermediate files
     base_name = os.path.splitext(os.path.basename(args.video))[0]
     output_dir = "output"
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
         
-    whisper_json_path = os.path.join(output_dir, f"{base_name}_whisper.json")
+    whisper_json_path = os.path.join(output_dir, f"{base_name}_whisper.jsonl")
     script_text_path = os.path.join(output_dir, f"{base_name}_script.txt")
 
-    print("=== Step 1: Generating Whisper Transcription ===")
-    if os.path.exists(whisper_json_path) and not args.duration:
-         print(f"File {whisper_json_path} already exists, skipping transcription (delete file to re-run).")
-    else:
-        if args.duration:
-            print(f"Duration limit set to {args.duration}s. Forced re-run of transcription.")
-        generate_whisper_script(args.video, whisper_json_path, model_size=args.whisper_model, duration=args.duration)
+    # Transcription and OCR use disjoint inputs and resources, so they run at the same time.
+    # Only Whisper runs in a child process: the OCR step is I/O-bound, and Gemini's APIError
+    # cannot be pickled back to the parent, which would break the pool and lose the transcription.
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        whisper_future = None
 
-    print("\n=== Step 2: Extracting Japanese Text from PDF ===")
-    if os.path.exists(script_text_path):
-        print(f"File {script_text_path} already exists, skipping OCR (delete file to re-run).")
-    else:
-        extract_jscript(args.script, script_text_path, api_key=args.api_key)
+        print("=== Step 1: Generating Whisper Transcription ===")
+        if os.path.isfile(whisper_json_path) and not args.duration:
+             print(f"File {whisper_json_path} already exists, skipping transcription (delete file to re-run).")
+        else:
+            if args.duration:
+                print(f"Duration limit set to {args.duration}s. Forced re-run of transcription.")
+            whisper_future = executor.submit(generate_whisper_script, args.video, whisper_json_path,
+                                             model_size=args.whisper_model, compute_type=args.compute_type,
+                                             duration=args.duration, batch_size=args.batch_size,
+                                             word_timestamps=args.word_timestamps, vad_filter=not args.no_vad)
+
+        print("\n=== Step 2: Extracting Japanese Text from PDF ===")
+        if os.path.isfile(script_text_path):
+            print(f"File {script_text_path} already exists, skipping OCR (delete file to re-run).")
+        else:
+            extract_jscript(args.script, script_text_path, api_key=args.api_key,
+                            batch_mode=args.batch_mode, use_cache=not args.no_cache)
+
+        # A transcription failure is re-raised here
+        if whisper_future:
+            whisper_future.result()
 
     print("\n=== Step 3: Aligning Scripts ===")
-    align_scripts(whisper_json_path, script_text_path, args.output, api_key=args.api_key)
+    align_scripts(whisper_json_path, script_text_path, args.output, api_key=args.api_key, batch_mode=args.batch_mode, use_cache=not args.no_cache)
 
     print(f"\nSUCCESS: Output saved to {args.output}")
 